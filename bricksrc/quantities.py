@@ -13,14 +13,10 @@ g.expand(profile="brick")
 
 def get_units(qudt_quantity):
     """
-    Fetches the QUDT unit and symbol (as a Literal) from the QUDT ontology so
-    in order to avoid having to pull the full QUDT ontology into Brick
+    Fetches the QUDT units applicable to the given quantity from the QUDT
+    ontology in order to avoid having to pull the full QUDT ontology into Brick
     """
-    return g.query(
-        f"""SELECT ?unit WHERE {{
-                    <{qudt_quantity}> qudt:applicableUnit ?unit .
-                }}"""
-    )
+    return g.objects(subject=URIRef(qudt_quantity), predicate=QUDT.applicableUnit)
 
 
 def all_units():
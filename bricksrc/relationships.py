@@ -1,189 +1,328 @@
+from collections.abc import Mapping
+from functools import lru_cache
+from types import MappingProxyType
 from rdflib import Literal
-from .namespaces import A, OWL, RDFS, BRICK, VCARD, UNIT, QUDT, SDO, RDF, S223, BSH, XSD
+from .namespaces import (
+    A,
+    OWL,
+    RDFS,
+    BRICK,
+    VCARD,
+    UNIT,
+    QUDT,
+    SDO,
+    RDF,
+    S223,
+    BSH,
+    XSD,
+    SH,
+)
 
 """
 Defining Brick relationships
 """
-relationships = {
-    "isReplacedBy": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        RDFS.label: Literal("Is replaced by"),
-        "range": BRICK.Entity,
-        "domain": BRICK.Entity,
-    },
-    "hasSubstance": {
-        A: [OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        RDFS.label: Literal("Has QUDT reference"),
-        "range": BRICK.Substance,
-        "domain": [BRICK.Point, BRICK.Meter],
-    },
-    "hasQuantity": {
-        A: [OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        RDFS.label: Literal("Has QUDT reference"),
-        RDFS.subPropertyOf: QUDT.hasQuantityKind,
-        "range": BRICK.Quantity,
-        "domain": BRICK.Point,
-    },
-    "value": {
-        RDFS.subPropertyOf: [QUDT.value, S223.hasValue],
-        RDFS.label: Literal("Value"),
-        A: [RDF.Property],
-        "range": RDFS.Resource,
-        "domain": RDFS.Resource,
-    },
-    "latitude": {
-        RDFS.subPropertyOf: SDO.latitude,
-        RDFS.label: Literal("Latitude"),
-        A: [OWL.ObjectProperty],
-        "domain": BRICK.Entity,
-        "datatype": BSH.NumericValue,
-    },
-    "longitude": {
-        RDFS.subPropertyOf: SDO.longitude,
-        RDFS.label: Literal("Longitude"),
-        A: [OWL.ObjectProperty],
-        "domain": BRICK.Entity,
-        "datatype": BSH.NumericValue,
-    },
-    "timestamp": {
-        RDFS.label: Literal("Timestamp"),
-        A: [RDF.Property],
-        "domain": BRICK.Entity,
-        "datatype": XSD.dateTime,
-    },
-    "hasQUDTReference": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        RDFS.label: Literal("Has QUDT reference"),
-        "domain": BRICK.Quantity,
-        "range": QUDT.QuantityKind,
-    },
-    "isLocationOf": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK["hasLocation"],
-        "domain": BRICK.Location,
-        "range": BRICK.Entity,
-        RDFS.label: Literal("Is location of"),
-    },
-    "hasLocation": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK["isLocationOf"],
-        "domain": BRICK.Entity,
-        "range": BRICK.Location,
-        RDFS.label: Literal("Has location"),
-    },
-    "hasInputSubstance": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        "range": BRICK.Substance,
-        "domain": BRICK.Equipment,
-        RDFS.label: Literal("Has input substance"),
-    },
-    "hasOutputSubstance": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        "range": BRICK.Substance,
-        "domain": BRICK.Equipment,
-        RDFS.label: Literal("Has output substance"),
-    },
-    "feeds": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK["isFedBy"],
-        RDFS.label: Literal("Feeds"),
-    },
-    "isFedBy": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK["feeds"],
-        RDFS.label: Literal("Is fed by"),
-    },
-    "hasPoint": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK["isPointOf"],
-        "range": BRICK.Point,
-        "domain": [BRICK.Equipment, BRICK.Location],
-        RDFS.label: Literal("Has point"),
-    },
-    "isPointOf": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK["hasPoint"],
-        "domain": BRICK.Point,
-        "range": [BRICK.Equipment, BRICK.Location],
-        RDFS.label: Literal("Is point of"),
-    },
-    "hasPart": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK["isPartOf"],
-        RDFS.label: Literal("Has part"),
-    },
-    "isPartOf": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK["hasPart"],
-        RDFS.label: Literal("Is part of"),
-    },
-    "hasTag": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK["isTagOf"],
-        "range": BRICK.Tag,
-        "domain": OWL.Class,
-        RDFS.label: Literal("Has tag"),
-    },
-    "isTagOf": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        "domain": BRICK.Tag,
-        "range": OWL.Class,
-        RDFS.label: Literal("Is tag of"),
-    },
-    "hasAssociatedTag": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK["isAssociatedWith"],
-        "domain": OWL.Class,
-        "range": BRICK.Tag,
-        RDFS.label: Literal("Has associated tag"),
-    },
-    "isAssociatedWith": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK["hasAssociatedTag"],
-        "domain": BRICK.Tag,
-        "range": OWL.Class,
-        RDFS.label: Literal("Is associated with"),
-    },
-    "hasAddress": {
-        RDFS.subPropertyOf: VCARD.hasAddress,
-        "domain": BRICK.Building,
-        "range": VCARD.Address,
-        RDFS.label: Literal("Has address"),
-    },
-    "hasUnit": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        "range": QUDT.Unit,
-        "domain": BRICK.Point,
-        RDFS.label: Literal("Has unit"),
-    },
-    "meters": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK.isMeteredBy,
-        "domain": BRICK.Meter,
-        # this is a special property that implements the 'range' as a SHACL shape
-        "range": [BRICK.Equipment, BRICK.Location, BRICK.Collection],
-        RDFS.label: Literal("meters"),
-    },
-    "isMeteredBy": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK.meters,
-        # this is a special property that implements the 'domain' as a SHACL shape
-        "domain": [BRICK.Equipment, BRICK.Location, BRICK.Collection],
-        "range": BRICK.Meter,
-        RDFS.label: Literal("is metered by"),
-    },
-    "hasSubMeter": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK.isSubMeterOf,
-        "range": BRICK.Meter,
-        "domain": BRICK.Meter,
-        RDFS.label: Literal("has sub-meter"),
-    },
-    "isSubMeterOf": {
-        A: [OWL.ObjectProperty, OWL.AsymmetricProperty, OWL.IrreflexiveProperty],
-        OWL.inverseOf: BRICK.hasSubMeter,
-        "range": BRICK.Meter,
-        "domain": BRICK.Meter,
-        RDFS.label: Literal("is sub-meter of"),
-    },
-}
+# keys for the parts of a definition that become SHACL constraints rather
+# than triples on the relationship itself (see define_relationships). They
+# are URIRefs like every other key in a definition, but Brick deliberately
+# does not emit rdfs:domain/rdfs:range triples for its relationships
+RANGE = RDFS.range
+DOMAIN = RDFS.domain
+DATATYPE = SH.datatype
+
+# multi-valued fields are tuples; the common ones are shared between definitions
+_OBJ_ASYM_IRREF = (
+    OWL.ObjectProperty,
+    OWL.AsymmetricProperty,
+    OWL.IrreflexiveProperty,
+)
+_ASYM_IRREF = (OWL.AsymmetricProperty, OWL.IrreflexiveProperty)
+_EQUIPMENT_OR_LOCATION = (BRICK.Equipment, BRICK.Location)
+_METERABLE = (BRICK.Equipment, BRICK.Location, BRICK.Collection)
+
+
+class _FrozenDefinition(Mapping):
+    """
+    Read-only, hashable view of a relationship definition (or of a table of
+    subproperty definitions), so definitions can be used as set members and
+    dictionary keys. All values must be hashable; the hash is computed once,
+    when the view is built
+    """
+
+    __slots__ = ("_defn", "_hash")
+
+    def __init__(self, defn):
+        self._defn = defn
+        self._hash = hash(frozenset(defn.items()))
+
+    def __getitem__(self, key):
+        return self._defn[key]
+
+    def __iter__(self):
+        return iter(self._defn)
+
+    def __len__(self):
+        return len(self._defn)
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._defn!r})"
+
+
+@lru_cache(maxsize=None)
+def _label(text):
+    return Literal(text)
+
+
+@lru_cache(maxsize=None)
+def _shared(value):
+    # returns the first value seen that is equal to 'value'
+    return value
+
+
+def _freeze(defn):
+    """
+    Returns a frozen copy of the definition. Labels are written as plain
+    text in the table (see _build_relationships); the Literal for each
+    distinct label text is built once here and shared between definitions,
+    as are equal tuples. Subproperty definitions are frozen recursively
+    """
+    frozen = {}
+    for key, value in defn.items():
+        if key == RDFS.label:
+            value = _label(value)
+        elif key == "subproperties":
+            value = _FrozenDefinition(
+                {name: _freeze(subdefn) for name, subdefn in value.items()}
+            )
+        elif isinstance(value, list):
+            value = _shared(tuple(value))
+        elif isinstance(value, tuple):
+            value = _shared(value)
+        frozen[key] = value
+    return _FrozenDefinition(frozen)
+
+
+def _define_inverse_pair(
+    table, name, inverse, label, inverse_label, domain=None, range_=None
+):
+    """
+    Adds the relationship 'name' and its owl:inverseOf 'inverse' to 'table'.
+    The domain and range of the inverse are the range and domain of 'name'
+    """
+    forward = {
+        A: _OBJ_ASYM_IRREF,
+        OWL.inverseOf: BRICK[inverse],
+        RDFS.label: label,
+    }
+    backward = {
+        A: _OBJ_ASYM_IRREF,
+        OWL.inverseOf: BRICK[name],
+        RDFS.label: inverse_label,
+    }
+    if domain is not None:
+        forward[DOMAIN] = domain
+        backward[RANGE] = domain
+    if range_ is not None:
+        forward[RANGE] = range_
+        backward[DOMAIN] = range_
+    table[name] = forward
+    table[inverse] = backward
+
+
+def _build_relationships():
+    """
+    Builds the read-only table of Brick relationships
+    """
+    table = {
+        "isReplacedBy": {
+            A: _OBJ_ASYM_IRREF,
+            RDFS.label: "Is replaced by",
+            RANGE: BRICK.Entity,
+            DOMAIN: BRICK.Entity,
+        },
+        "hasSubstance": {
+            A: _ASYM_IRREF,
+            RDFS.label: "Has substance",
+            RANGE: BRICK.Substance,
+            DOMAIN: (BRICK.Point, BRICK.Meter),
+        },
+        "hasQuantity": {
+            A: _ASYM_IRREF,
+            RDFS.label: "Has quantity",
+            RDFS.subPropertyOf: QUDT.hasQuantityKind,
+            RANGE: BRICK.Quantity,
+            DOMAIN: BRICK.Point,
+        },
+        "value": {
+            RDFS.subPropertyOf: (QUDT.value, S223.hasValue),
+            RDFS.label: "Value",
+            A: (RDF.Property,),
+            RANGE: RDFS.Resource,
+            DOMAIN: RDFS.Resource,
+        },
+        "latitude": {
+            RDFS.subPropertyOf: SDO.latitude,
+            RDFS.label: "Latitude",
+            A: (OWL.ObjectProperty,),
+            DOMAIN: BRICK.Entity,
+            DATATYPE: BSH.NumericValue,
+        },
+        "longitude": {
+            RDFS.subPropertyOf: SDO.longitude,
+            RDFS.label: "Longitude",
+            A: (OWL.ObjectProperty,),
+            DOMAIN: BRICK.Entity,
+            DATATYPE: BSH.NumericValue,
+        },
+        "timestamp": {
+            RDFS.label: "Timestamp",
+            A: (RDF.Property,),
+            DOMAIN: BRICK.Entity,
+            DATATYPE: XSD.dateTime,
+        },
+        "hasQUDTReference": {
+            A: _OBJ_ASYM_IRREF,
+            RDFS.label: "Has QUDT reference",
+            DOMAIN: BRICK.Quantity,
+            RANGE: QUDT.QuantityKind,
+        },
+        "hasInputSubstance": {
+            A: _OBJ_ASYM_IRREF,
+            RANGE: BRICK.Substance,
+            DOMAIN: BRICK.Equipment,
+            RDFS.label: "Has input substance",
+        },
+        "hasOutputSubstance": {
+            A: _OBJ_ASYM_IRREF,
+            RANGE: BRICK.Substance,
+            DOMAIN: BRICK.Equipment,
+            RDFS.label: "Has output substance",
+        },
+        "hasAddress": {
+            RDFS.subPropertyOf: VCARD.hasAddress,
+            DOMAIN: BRICK.Building,
+            RANGE: VCARD.Address,
+            RDFS.label: "Has address",
+        },
+        "hasUnit": {
+            A: _OBJ_ASYM_IRREF,
+            RANGE: QUDT.Unit,
+            DOMAIN: BRICK.Point,
+            RDFS.label: "Has unit",
+        },
+    }
+
+    _define_inverse_pair(
+        table,
+        "hasLocation",
+        "isLocationOf",
+        "Has location",
+        "Is location of",
+        domain=BRICK.Entity,
+        range_=BRICK.Location,
+    )
+    _define_inverse_pair(table, "feeds", "isFedBy", "Feeds", "Is fed by")
+    _define_inverse_pair(
+        table,
+        "hasPoint",
+        "isPointOf",
+        "Has point",
+        "Is point of",
+        domain=_EQUIPMENT_OR_LOCATION,
+        range_=BRICK.Point,
+    )
+    _define_inverse_pair(table, "hasPart", "isPartOf", "Has part", "Is part of")
+    _define_inverse_pair(
+        table,
+        "hasTag",
+        "isTagOf",
+        "Has tag",
+        "Is tag of",
+        domain=OWL.Class,
+        range_=BRICK.Tag,
+    )
+    _define_inverse_pair(
+        table,
+        "hasAssociatedTag",
+        "isAssociatedWith",
+        "Has associated tag",
+        "Is associated with",
+        domain=OWL.Class,
+        range_=BRICK.Tag,
+    )
+    # meters/isMeteredBy are special properties that implement the Equipment,
+    # Location or Collection side (range of meters, domain of isMeteredBy)
+    # as a SHACL shape
+    _define_inverse_pair(
+        table,
+        "meters",
+        "isMeteredBy",
+        "meters",
+        "is metered by",
+        domain=BRICK.Meter,
+        range_=_METERABLE,
+    )
+    _define_inverse_pair(
+        table,
+        "hasSubMeter",
+        "isSubMeterOf",
+        "has sub-meter",
+        "is sub-meter of",
+        domain=BRICK.Meter,
+        range_=BRICK.Meter,
+    )
+
+    # the table is only ever read, so expose it (and each definition) read-only
+    return MappingProxyType({name: _freeze(defn) for name, defn in table.items()})
+
+
+def _as_tuple(value):
+    return value if isinstance(value, tuple) else (value,)
+
+
+def _build_indexes(table):
+    """
+    Indexes the relationships by their full URI in a single pass over the
+    table, so consumers can look up inverses, superproperties, domains and
+    ranges without rescanning it. Multi-valued entries are always tuples
+    """
+    inverse_of = {}
+    subproperty_of = {}
+    domain_of = {}
+    range_of = {}
+    for name, defn in table.items():
+        prop = BRICK[name]
+        if OWL.inverseOf in defn:
+            inverse_of[prop] = defn[OWL.inverseOf]
+        if RDFS.subPropertyOf in defn:
+            subproperty_of[prop] = _as_tuple(defn[RDFS.subPropertyOf])
+        if DOMAIN in defn:
+            domain_of[prop] = _as_tuple(defn[DOMAIN])
+        if RANGE in defn:
+            range_of[prop] = _as_tuple(defn[RANGE])
+    return {
+        "inverse_of": MappingProxyType(inverse_of),
+        "subproperty_of": MappingProxyType(subproperty_of),
+        "domain_of": MappingProxyType(domain_of),
+        "range_of": MappingProxyType(range_of),
+    }
+
+
+_INDEXES = ("inverse_of", "subproperty_of", "domain_of", "range_of")
+
+
+def __getattr__(name):
+    # build the table (and the indexes over it) on first access, then cache
+    # them as module globals so that later lookups bypass this hook
+    if name == "relationships":
+        globals()[name] = _build_relationships()
+    elif name in _INDEXES:
+        table = globals().get("relationships")
+        if table is None:
+            table = __getattr__("relationships")
+        globals().update(_build_indexes(table))
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return globals()[name]
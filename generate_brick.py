@@ -1,14 +1,13 @@
 import os
 from pathlib import Path
 import sys
-import csv
 import glob
-import ontoenv
 import logging
-import pyshacl
+from collections.abc import Mapping
+from functools import lru_cache
+from itertools import permutations
 from rdflib import Graph, Literal, BNode, URIRef
 from rdflib.namespace import XSD
-from rdflib.collection import Collection
 
 from bricksrc.ontology import define_ontology, ontology_imports
 
@@ -45,7 +44,7 @@ from bricksrc.equipment import (
     safety_subclasses,
 )
 from bricksrc.substances import substances
-from bricksrc.relationships import relationships
+from bricksrc.relationships import relationships, RANGE, DOMAIN, DATATYPE
 from bricksrc.quantities import quantity_definitions, get_units
 from bricksrc.entity_properties import entity_properties, get_shapes
 from bricksrc.deprecations import deprecations
@@ -59,52 +58,93 @@ logging.basicConfig(
 G = Graph()
 bind_prefixes(G)
 A = RDF.type
+# the xsd:integer 1 used as the cardinality of many shapes
+ONE = Literal(1)
+TRUE = Literal(True)
+# keys of concept, class and relationship definitions that are handled
+# explicitly; every other key in a definition is a property of the term
+CONCEPT_KEYS = frozenset(["parents", "tags", "substances"])
+CLASS_KEYS = frozenset(["parents", "tags", "substances", "subclasses", "constraints"])
+RELATIONSHIP_KEYS = frozenset(["subproperties", A, RANGE, DATATYPE, DOMAIN])
 
 shaclGraph = Graph()
 bind_prefixes(shaclGraph)
 intersection_classes = {}
 has_tag_restriction_class = {}
+# keyed by the tag URI as a plain str: str keys hash and compare in C,
+# whereas comparing URIRefs goes through rdflib's Python __eq__
 shacl_tag_property_shapes = {}
 has_exactly_n_tags_shapes = {}
+# URI fragment of each tag declared by add_tags, also keyed by str
+tag_names = {}
+# subjects that have an rdfs:label in G; see has_label
+labeled_subjects = set()
+# property shapes with only an rdf:type and sh:path, made for optional
+# properties by define_shape_property_property, keyed by the path
+optional_property_shapes = {}
 
 
 def add_relationships(item, propdefs):
+    triples = []
     for propname, propval in propdefs.items():
-        if isinstance(propval, list):
-            for pv in propval:
-                G.add((item, propname, pv))
+        # most values are single terms, so check for those first
+        value_type = type(propval)
+        if value_type is URIRef or value_type is Literal:
+            triples.append((item, propname, propval))
+        elif isinstance(propval, (list, tuple)):
+            triples.extend((item, propname, pv) for pv in propval)
         elif not isinstance(propval, dict):
-            G.add((item, propname, propval))
-
-
-def get_units_brick(brick_quantity):
-    brick_units = G.query(
-        f"""SELECT ?unit ?symbol ?label WHERE {{
-        ?subquant skos:broader+ <{brick_quantity}> .
-        ?subquant qudt:applicableUnit ?unit .
-        OPTIONAL {{
-            ?unit qudt:symbol ?symbol .
-            FILTER(isLiteral(?symbol))
-        }} .
-        OPTIONAL {{
-            ?unit rdfs:label ?label .
-        }}
-    }}"""
-    )
-    return set(brick_units)
+            triples.append((item, propname, propval))
+    G.addN((s, p, o, G) for s, p, o in triples)
+    if RDFS.label in propdefs:
+        labeled_subjects.add(item)
 
 
+@lru_cache(maxsize=None)
 def units_for_quantity(quantity):
     """
-    Given a Brick Quantity (the full URI), returns the list of applicable units
+    Given a Brick Quantity (the full URI), returns a tuple of the applicable
+    units. Results are cached, so this must only be called once the units
+    have been associated with the Brick quantities
     """
     brick_units = set(G.objects(subject=quantity, predicate=QUDT.applicableUnit))
     qudt_units = set(get_units(quantity))
-    return list(brick_units.union(qudt_units))
+    return tuple(brick_units.union(qudt_units))
 
 
 def has_label(concept):
-    return len(list(G.objects(subject=concept, predicate=RDFS.label))) > 0
+    return concept in labeled_subjects
+
+
+def add_label(subject, label):
+    """
+    Adds an rdfs:label to 'subject', keeping labeled_subjects up to date
+    """
+    G.add((subject, RDFS.label, Literal(label)))
+    labeled_subjects.add(subject)
+
+
+def rdf_list_triples(head, items):
+    """
+    Returns the triples of an RDF list of 'items' starting at the node 'head',
+    like rdflib's Collection would add for a new list
+    """
+    items = list(items)
+    if len(items) == 0:
+        return []
+    nodes = [head] + [BNode() for _ in items[1:]]
+    triples = []
+    for node, item, rest in zip(nodes, items, nodes[1:] + [RDF.nil]):
+        triples.append((node, RDF.first, item))
+        triples.append((node, RDF.rest, rest))
+    return triples
+
+
+def add_rdf_list(head, items):
+    """
+    Adds an RDF list of 'items' starting at the node 'head' to G
+    """
+    G.addN((s, p, o, G) for s, p, o in rdf_list_triples(head, items))
 
 
 def add_tags(klass, definition):
@@ -129,78 +169,88 @@ def add_tags(klass, definition):
     """
     if len(definition) == 0:
         return
-    for tag in definition:
-        G.add((klass, BRICK.hasAssociatedTag, tag))
-        G.add((tag, A, BRICK.Tag))  # make sure the tag is declared as such
-        G.add(
-            (tag, RDFS.label, Literal(tag.split("#")[-1]))
-        )  # make sure the tag is declared as such
+    # collect the triples for G and for the SHACL graph and add them in batches
+    triples = []
+    shacl_triples = []
+    klass_name = klass.rsplit("#", 1)[-1]
+    tag_keys = [str(tag) for tag in definition]
+    for tag, tag_key in zip(definition, tag_keys):
+        triples.append((klass, BRICK.hasAssociatedTag, tag))
+        # make sure the tag is declared as such; this only needs to happen
+        # the first time the tag is seen
+        if tag_key not in tag_names:
+            tag_names[tag_key] = tag_key.rsplit("#", 1)[-1]
+            triples.append((tag, A, BRICK.Tag))
+            triples.append((tag, RDFS.label, Literal(tag_names[tag_key])))
+            labeled_subjects.add(tag)
 
     # add SHACL shape
-    sc = BSH[klass.split("#")[-1] + "_TagShape"]
-    shaclGraph.add((sc, A, SH.NodeShape))
+    sc = BSH[klass_name + "_TagShape"]
+    shacl_triples.append((sc, A, SH.NodeShape))
     # G.add((sc, SH.targetSubjectsOf, BRICK.hasTag))
     rule = BNode(str(klass) + "TagInferenceRule")
-    shaclGraph.add((sc, SH.rule, rule))
+    shacl_triples.append((sc, SH.rule, rule))
 
     # define rule
-    shaclGraph.add((rule, A, SH.TripleRule))
-    shaclGraph.add((rule, SH.subject, SH.this))
-    shaclGraph.add((rule, SH.predicate, RDF.type))
-    shaclGraph.add((rule, SH.object, klass))
+    shacl_triples.append((rule, A, SH.TripleRule))
+    shacl_triples.append((rule, SH.subject, SH.this))
+    shacl_triples.append((rule, SH.predicate, RDF.type))
+    shacl_triples.append((rule, SH.object, klass))
     # conditions
-    for tag in definition:
-        classrule = BNode(f"add_{tag.split('#')[-1]}_to_{klass.split('#')[-1]}")
-        G.add((klass, A, SH.NodeShape))
-        G.add((klass, SH.rule, classrule))
-        G.add((classrule, A, SH.TripleRule))
-        G.add((classrule, SH.subject, SH.this))
-        G.add((classrule, SH.predicate, BRICK.hasTag))
-        G.add((classrule, SH.object, tag))
-        if tag not in shacl_tag_property_shapes:
-            cond = BNode(f"has_{tag.split('#')[-1]}_condition")
-            prop = BNode(f"has_{tag.split('#')[-1]}_tag")
+    triples.append((klass, A, SH.NodeShape))
+    for tag, tag_key in zip(definition, tag_keys):
+        tag_name = tag_names[tag_key]
+        classrule = BNode(f"add_{tag_name}_to_{klass_name}")
+        triples.append((klass, SH.rule, classrule))
+        triples.append((classrule, A, SH.TripleRule))
+        triples.append((classrule, SH.subject, SH.this))
+        triples.append((classrule, SH.predicate, BRICK.hasTag))
+        triples.append((classrule, SH.object, tag))
+        if tag_key not in shacl_tag_property_shapes:
+            cond = BNode(f"has_{tag_name}_condition")
+            prop = BNode(f"has_{tag_name}_tag")
             tagshape = BNode()
-            shaclGraph.add((rule, SH.condition, cond))
-            shaclGraph.add((cond, SH.property, prop))
-            shaclGraph.add((prop, SH.path, BRICK.hasTag))
-            shaclGraph.add((prop, SH.qualifiedValueShape, tagshape))
-            shaclGraph.add((tagshape, SH.hasValue, tag))
-            shaclGraph.add(
-                (prop, SH.qualifiedMinCount, Literal(1, datatype=XSD.integer))
-            )
+            shacl_triples.append((rule, SH.condition, cond))
+            shacl_triples.append((cond, SH.property, prop))
+            shacl_triples.append((prop, SH.path, BRICK.hasTag))
+            shacl_triples.append((prop, SH.qualifiedValueShape, tagshape))
+            shacl_triples.append((tagshape, SH.hasValue, tag))
+            shacl_triples.append((prop, SH.qualifiedMinCount, ONE))
 
             # probably don't need the Max count here; addition of duplicate tags should be idempotent
             # shaclGraph.add((prop, SH.qualifiedMaxCount, Literal(1)))
-            shacl_tag_property_shapes[tag] = cond
-        shaclGraph.add((rule, SH.condition, shacl_tag_property_shapes[tag]))
+            shacl_tag_property_shapes[tag_key] = cond
+        shacl_triples.append((rule, SH.condition, shacl_tag_property_shapes[tag_key]))
     num_tags = len(definition)
     if len(definition) not in has_exactly_n_tags_shapes:
         # tag count condition
         cond = BSH[f"has_exactly_{num_tags}_tags_condition"]
         prop = BNode(f"has_exactly_{num_tags}_tags")
-        shaclGraph.add((cond, A, OWL.Class))
-        shaclGraph.add((cond, A, SH.NodeShape))
-        shaclGraph.add((cond, SH.property, prop))
-        shaclGraph.add((prop, SH.path, BRICK.hasTag))
-        shaclGraph.add((prop, SH.minCount, Literal(len(definition))))
-        shaclGraph.add((prop, SH.maxCount, Literal(len(definition))))
+        shacl_triples.append((cond, A, OWL.Class))
+        shacl_triples.append((cond, A, SH.NodeShape))
+        shacl_triples.append((cond, SH.property, prop))
+        shacl_triples.append((prop, SH.path, BRICK.hasTag))
+        count = Literal(num_tags)
+        shacl_triples.append((prop, SH.minCount, count))
+        shacl_triples.append((prop, SH.maxCount, count))
         has_exactly_n_tags_shapes[len(definition)] = cond
 
         # generate inference rule
         rule = BSH[f"has_exactly_{num_tags}_tags_rule"]
         body = BNode(f"has_{num_tags}_tags_body")
-        shaclGraph.add((rule, A, SH.NodeShape))
-        shaclGraph.add((rule, SH.targetSubjectsOf, BRICK.hasTag))
-        shaclGraph.add((rule, SH.rule, body))
-        shaclGraph.add((body, A, SH.TripleRule))
-        shaclGraph.add((body, SH.subject, SH.this))
-        shaclGraph.add((body, SH.predicate, RDF.type))
-        shaclGraph.add((body, SH.object, cond))
-        shaclGraph.add((body, SH.condition, cond))
+        shacl_triples.append((rule, A, SH.NodeShape))
+        shacl_triples.append((rule, SH.targetSubjectsOf, BRICK.hasTag))
+        shacl_triples.append((rule, SH.rule, body))
+        shacl_triples.append((body, A, SH.TripleRule))
+        shacl_triples.append((body, SH.subject, SH.this))
+        shacl_triples.append((body, SH.predicate, RDF.type))
+        shacl_triples.append((body, SH.object, cond))
+        shacl_triples.append((body, SH.condition, cond))
     # shaclGraph.add((rule, SH.condition, has_exactly_n_tags_shapes[len(definition)]))
 
-    shaclGraph.add((sc, SH.targetClass, has_exactly_n_tags_shapes[len(definition)]))
+    shacl_triples.append(
+        (sc, SH.targetClass, has_exactly_n_tags_shapes[len(definition)])
+    )
 
     # ensure that the rule applies to at least one of the base tags that should be on
     # most Brick classes
@@ -209,6 +259,8 @@ def add_tags(klass, definition):
     # assert len(target_class_tag) > 0, klass
     # shaclGraph.add((sc, SH.targetClass, has_tag_restriction_class[target_class_tag[0]]))
     # shaclGraph.add((sc, SH.targetSubjectsOf, BRICK.hasTag))
+    G.addN((s, p, o, G) for s, p, o in triples)
+    shaclGraph.addN((s, p, o, shaclGraph) for s, p, o in shacl_triples)
 
 
 def define_concept_hierarchy(definitions, typeclasses, broader=None, related=None):
@@ -220,7 +272,17 @@ def define_concept_hierarchy(definitions, typeclasses, broader=None, related=Non
 
     Currently this is used for Brick Quantities
     """
-    for concept, defn in definitions.items():
+    # walk the nested definitions depth-first, visiting concepts in the same
+    # order as a recursive descent. Each entry holds the concepts left at one
+    # level along with their broader and related concepts
+    stack = [(iter(definitions.items()), broader, related)]
+    while stack:
+        concepts, broader, related = stack[-1]
+        entry = next(concepts, None)
+        if entry is None:
+            stack.pop()
+            continue
+        concept, defn = entry
         concept = BRICK[concept]
         for typeclass in typeclasses:
             G.add((concept, A, typeclass))
@@ -233,18 +295,9 @@ def define_concept_hierarchy(definitions, typeclasses, broader=None, related=Non
             G.add((concept, SKOS.related, related))
             G.add((related, SKOS.related, concept))
         # add label
-        label = defn.get(RDFS.label, concept.split("#")[-1].replace("_", " "))
+        label = defn.get(RDFS.label, concept.rsplit("#", 1)[-1].replace("_", " "))
         if not has_label(concept):
-            G.add((concept, RDFS.label, Literal(label)))
-
-        # define concept hierarchy
-        # this is a nested dictionary
-        narrower_defs = defn.get(SKOS.narrower, {})
-        if narrower_defs is not None and isinstance(narrower_defs, dict):
-            define_concept_hierarchy(narrower_defs, typeclasses, broader=concept)
-        related_defs = defn.get(SKOS.related, {})
-        if related_defs is not None and isinstance(related_defs, dict):
-            define_concept_hierarchy(related_defs, typeclasses, related=concept)
+            add_label(concept, label)
 
         # handle 'parents' subconcepts (links outside of tree-based hierarchy)
         parents = defn.get("parents", [])
@@ -254,12 +307,19 @@ def define_concept_hierarchy(definitions, typeclasses, broader=None, related=Non
 
         # all other key-value pairs in the definition are
         # property-object pairs
-        expected_properties = ["parents", "tags", "substances"]
-        other_properties = [
-            prop for prop in defn.keys() if prop not in expected_properties
-        ]
+        other_properties = [prop for prop in defn.keys() if prop not in CONCEPT_KEYS]
         add_relationships(concept, {k: defn[k] for k in other_properties})
 
+        # define concept hierarchy
+        # this is a nested dictionary. The narrower concepts are pushed last
+        # so they are visited before the related ones
+        related_defs = defn.get(SKOS.related, {})
+        if related_defs is not None and isinstance(related_defs, dict):
+            stack.append((iter(related_defs.items()), None, concept))
+        narrower_defs = defn.get(SKOS.narrower, {})
+        if narrower_defs is not None and isinstance(narrower_defs, dict):
+            stack.append((iter(narrower_defs.items()), concept, None))
+
 
 def define_classes(definitions, parent, pun_classes=False):
     """
@@ -271,19 +331,30 @@ def define_classes(definitions, parent, pun_classes=False):
 
     If pun_classes is True, then create punned instances of the classes
     """
-    for classname, defn in definitions.items():
+    triples = []
+    # walk the nested definitions depth-first, visiting classes in the same
+    # order as a recursive descent. Only the top-level classes are punned
+    stack = [(iter(definitions.items()), parent, pun_classes)]
+    while stack:
+        classes, parent, pun_classes = stack[-1]
+        entry = next(classes, None)
+        if entry is None:
+            stack.pop()
+            continue
+        classname, defn = entry
         classname = BRICK[classname]
         # class is a owl:Class
-        G.add((classname, A, OWL.Class))
+        triples.append((classname, A, OWL.Class))
         # subclass of parent
-        G.add((classname, RDFS.subClassOf, parent))
+        triples.append((classname, RDFS.subClassOf, parent))
         # add label
-        class_label = classname.split("#")[-1].replace("_", " ")
+        class_label = classname.rsplit("#", 1)[-1].replace("_", " ")
 
         if not has_label(classname):
-            G.add((classname, RDFS.label, Literal(class_label)))
+            triples.append((classname, RDFS.label, Literal(class_label)))
+            labeled_subjects.add(classname)
         if pun_classes:
-            G.add((classname, A, classname))
+            triples.append((classname, A, classname))
 
         # define mapping to tags if it exists
         # "tags" property is a list of URIs naming Tags
@@ -293,17 +364,11 @@ def define_classes(definitions, parent, pun_classes=False):
             logging.warning(f"Property 'tags' not defined for {classname}")
         add_tags(classname, taglist)
 
-        # define class structure
-        # this is a nested dictionary
-        subclassdef = defn.get("subclasses", {})
-        assert isinstance(subclassdef, dict)
-        define_classes(subclassdef, classname)
-
         # handle 'parents' subclasses (links outside of tree-based hierarchy)
         parents = defn.get("parents", [])
         assert isinstance(parents, list)
         for _parent in parents:
-            G.add((classname, RDFS.subClassOf, _parent))
+            triples.append((classname, RDFS.subClassOf, _parent))
 
         # add SHACL constraints to the class
         constraints = defn.get("constraints", {})
@@ -312,23 +377,23 @@ def define_classes(definitions, parent, pun_classes=False):
 
         # all other key-value pairs in the definition are
         # property-object pairs
-        expected_properties = [
-            "parents",
-            "tags",
-            "substances",
-            "subclasses",
-            "constraints",
-        ]
-        other_properties = [
-            prop for prop in defn.keys() if prop not in expected_properties
-        ]
+        other_properties = [prop for prop in defn.keys() if prop not in CLASS_KEYS]
         for propname in other_properties:
             propval = defn[propname]
             if isinstance(propval, list):
                 for pv in propval:
-                    G.add((classname, propname, pv))
+                    triples.append((classname, propname, pv))
             else:
-                G.add((classname, propname, propval))
+                triples.append((classname, propname, propval))
+        if RDFS.label in other_properties:
+            labeled_subjects.add(classname)
+
+        # define class structure
+        # this is a nested dictionary
+        subclassdef = defn.get("subclasses", {})
+        assert isinstance(subclassdef, dict)
+        stack.append((iter(subclassdef.items()), classname, False))
+    G.addN((s, p, o, G) for s, p, o in triples)
 
 
 def define_constraints(constraints, classname):
@@ -353,7 +418,7 @@ def define_constraints(constraints, classname):
                 pvnode = BNode()
                 G.add((pvnode, SH["class"], pv))
                 possible_values.append(pvnode)
-            Collection(G, onode, possible_values)
+            add_rdf_list(onode, possible_values)
         else:
             raise Exception("Do not know how to handle constraints for %s" % classname)
 
@@ -364,6 +429,7 @@ def define_entity_properties(definitions, superprop=None):
     Like most other generation methods in this file, it can add additional
     properties to the EntityProperty instances (like SKOS.definition)
     """
+    triples = []
     for entprop, defn in definitions.items():
         assert (
             "property_of" in defn
@@ -372,19 +438,21 @@ def define_entity_properties(definitions, superprop=None):
             SH.node in defn
         ), f"{entprop} missing a SH.node annotation so Brick doesn't know what the values of this property can be"
         assert RDFS.label in defn, f"{entprop} missing a RDFS.label annotation"
-        G.add((entprop, A, BRICK.EntityProperty))
+        triples.append((entprop, A, BRICK.EntityProperty))
         if superprop is not None:
-            G.add((entprop, RDFS.subPropertyOf, superprop))
+            triples.append((entprop, RDFS.subPropertyOf, superprop))
         if "subproperties" in defn:
             subproperties = defn.pop("subproperties")
             define_entity_properties(subproperties, entprop)
 
         sh_node = defn.pop(SH.node)
-        pshape = BSH[f"has{entprop.split('#')[-1]}Shape"]
-        G.add((pshape, A, SH.PropertyShape))
-        G.add((pshape, SH.path, entprop))
-        G.add((pshape, SH.node, sh_node))
-        G.add((pshape, RDFS.label, Literal(f"has {defn.get(RDFS.label)} property")))
+        pshape = BSH[f"has{entprop.rsplit('#', 1)[-1]}Shape"]
+        triples.append((pshape, A, SH.PropertyShape))
+        triples.append((pshape, SH.path, entprop))
+        triples.append((pshape, SH.node, sh_node))
+        triples.append(
+            (pshape, RDFS.label, Literal(f"has {defn.get(RDFS.label)} property"))
+        )
 
         # add the entity property as a sh:property on all of the
         # other Nodeshapes indicated by "property_of"
@@ -392,14 +460,15 @@ def define_entity_properties(definitions, superprop=None):
         if not isinstance(shapes, list):
             shapes = [shapes]
         for shape in shapes:
-            G.add((shape, SH.property, pshape))
+            triples.append((shape, SH.property, pshape))
 
         for prop, values in defn.items():
             if isinstance(values, list):
                 for pv in values:
-                    G.add((entprop, prop, pv))
+                    triples.append((entprop, prop, pv))
             else:
-                G.add((entprop, prop, values))
+                triples.append((entprop, prop, values))
+    G.addN((s, p, o, G) for s, p, o in triples)
 
 
 def define_shape_property_property(shape_name, definitions):
@@ -410,6 +479,7 @@ def define_shape_property_property(shape_name, definitions):
     # G.add((shape_detection_rule, SH.object, shape_name))
     # G.add((shape_detection_rule, SH.condition, shape_name))
 
+    triples = []
     if "or" in definitions:
         or_list = []
         for or_node_defn in definitions.pop("or"):
@@ -417,60 +487,58 @@ def define_shape_property_property(shape_name, definitions):
             or_list.append(or_node_shape)
             define_shape_property_property(or_node_shape, or_node_defn)
         or_list_name = BNode()
-        G.add((shape_name, SH["or"], or_list_name))
-        Collection(G, or_list_name, or_list)
+        triples.append((shape_name, SH["or"], or_list_name))
+        triples.extend(rdf_list_triples(or_list_name, or_list))
     for prop_name, prop_defn in definitions.items():
         # check if there is already a property shape for this.
         # Only do this is if (a) the property is optional for this shape, and
         # (b) there are no further requirements; the existing property shapes
         # don't have any min/max counts or additional requirements
-        if prop_defn.get("optional", False) and len(prop_defn.keys()) == 1:
-            prop_exists = list(
-                G.query(
-                    f"""SELECT ?x {{ ?p sh:property ?p .
-                        ?p sh:path {prop_name.n3()} .
-                        FILTER NOT EXISTS {{ ?p sh:minCount ?mc }}
-                        FILTER NOT EXISTS {{ ?p sh:maxCount ?mc }}
-                    }}"""
-                )
+        reusable = prop_defn.get("optional", False) and len(prop_defn.keys()) == 1
+        if reusable and prop_name in optional_property_shapes:
+            triples.append(
+                (shape_name, SH.property, optional_property_shapes[prop_name])
             )
-            if len(prop_exists) > 0:
-                G.add((shape_name, SH.property, prop_exists[0][0]))
-                continue  # continue to next property
+            continue  # continue to next property
 
         ps = BNode()
-        G.add((shape_name, SH.property, ps))
-        G.add((ps, A, SH.PropertyShape))
-        G.add((ps, SH.path, prop_name))
+        if reusable:
+            optional_property_shapes[prop_name] = ps
+        triples.append((shape_name, SH.property, ps))
+        triples.append((ps, A, SH.PropertyShape))
+        triples.append((ps, SH.path, prop_name))
         if "import_from" in prop_defn:
             fname = prop_defn.pop("import_from")
             tmpG = Graph()
             tmpG.parse(fname)
             res = tmpG.query(f"SELECT ?p ?o WHERE {{ <{prop_name}> ?p ?o }}")
             for p, o in res:
-                G.add((prop_name, p, o))
+                triples.append((prop_name, p, o))
         if "optional" in prop_defn:
             if not prop_defn.pop("optional"):
-                G.add((ps, SH.minCount, Literal(1)))
+                triples.append((ps, SH.minCount, ONE))
         else:
-            G.add((ps, SH.minCount, Literal(1)))
+            triples.append((ps, SH.minCount, ONE))
 
         if "datatype" in prop_defn:
             dtype = prop_defn.pop("datatype")
-            G.add((prop_name, A, OWL.DatatypeProperty))
+            triples.append((prop_name, A, OWL.DatatypeProperty))
             if dtype == BSH.NumericValue:
-                G.add((ps, SH["or"], BSH.NumericValue))
+                triples.append((ps, SH["or"], BSH.NumericValue))
             else:
-                G.add((ps, SH.datatype, dtype))
+                triples.append((ps, SH.datatype, dtype))
         elif "values" in prop_defn:
             enumeration = BNode()
-            G.add((ps, SH["in"], enumeration))
-            G.add((ps, SH.minCount, Literal(1)))
-            Collection(G, enumeration, map(Literal, prop_defn.pop("values")))
-            G.add((prop_name, A, OWL.ObjectProperty))
+            triples.append((ps, SH["in"], enumeration))
+            triples.append((ps, SH.minCount, ONE))
+            triples.extend(
+                rdf_list_triples(enumeration, map(Literal, prop_defn.pop("values")))
+            )
+            triples.append((prop_name, A, OWL.ObjectProperty))
         else:
-            G.add((prop_name, A, OWL.ObjectProperty))
+            triples.append((prop_name, A, OWL.ObjectProperty))
         add_relationships(ps, prop_defn)
+    G.addN((s, p, o, G) for s, p, o in triples)
 
 
 def define_shape_properties(definitions):
@@ -497,43 +565,38 @@ def define_shape_properties(definitions):
         G.add((shape_name, A, BRICK.EntityPropertyValue))
         G.add((shape_name, RDFS.subClassOf, BSH.ValueShape))
 
+        # the brick:value PropertyShape is set up here once; the "values" and
+        # "datatype" branches below only add their constraints to it
         needs_value_properties = ["values", "units", "unitsFromQuantity", "datatype"]
         brick_value_shape = BNode()
         if any(k in defn for k in needs_value_properties):
             G.add((shape_name, SH.property, brick_value_shape))
             G.add((brick_value_shape, A, SH.PropertyShape))
             G.add((brick_value_shape, SH.path, BRICK.value))
-            G.add((brick_value_shape, SH.minCount, Literal(1)))
-            G.add((brick_value_shape, SH.maxCount, Literal(1)))
+            G.add((brick_value_shape, SH.minCount, ONE))
+            G.add((brick_value_shape, SH.maxCount, ONE))
 
-        v = BNode()
         # prop:value PropertyShape
         if "values" in defn:
             enumeration = BNode()
-            G.add((shape_name, SH.property, brick_value_shape))
-            G.add((brick_value_shape, A, SH.PropertyShape))
-            G.add((brick_value_shape, SH.path, BRICK.value))
             G.add((brick_value_shape, SH["in"], enumeration))
-            G.add((brick_value_shape, SH.minCount, Literal(1)))
             vals = defn.pop("values")
             if isinstance(vals[0], str):
-                Collection(
-                    G, enumeration, map(lambda x: Literal(x, datatype=XSD.string), vals)
+                add_rdf_list(
+                    enumeration, map(lambda x: Literal(x, datatype=XSD.string), vals)
                 )
             elif isinstance(vals[0], int):
-                Collection(
-                    G,
+                add_rdf_list(
                     enumeration,
                     map(lambda x: Literal(x, datatype=XSD.integer), vals),
                 )
             elif isinstance(vals[0], float):
-                Collection(
-                    G,
+                add_rdf_list(
                     enumeration,
                     map(lambda x: Literal(x, datatype=XSD.decimal), vals),
                 )
             else:
-                Collection(G, enumeration, map(Literal, vals))
+                add_rdf_list(enumeration, map(Literal, vals))
         if "units" in defn:
             v = BNode()
             enumeration = BNode()
@@ -541,9 +604,9 @@ def define_shape_properties(definitions):
             G.add((v, A, SH.PropertyShape))
             G.add((v, SH.path, BRICK.hasUnit))
             G.add((v, SH["in"], enumeration))
-            G.add((v, SH.minCount, Literal(1)))
-            G.add((v, SH.maxCount, Literal(1)))
-            Collection(G, enumeration, defn.pop("units"))
+            G.add((v, SH.minCount, ONE))
+            G.add((v, SH.maxCount, ONE))
+            add_rdf_list(enumeration, defn.pop("units"))
         if "unitsFromQuantity" in defn:
             v = BNode()
             enumeration = BNode()
@@ -551,24 +614,20 @@ def define_shape_properties(definitions):
             G.add((v, A, SH.PropertyShape))
             G.add((v, SH.path, BRICK.hasUnit))
             G.add((v, SH["in"], enumeration))
-            G.add((v, SH.minCount, Literal(1)))
-            G.add((v, SH.maxCount, Literal(1)))
+            G.add((v, SH.minCount, ONE))
+            G.add((v, SH.maxCount, ONE))
             units = units_for_quantity(defn.pop("unitsFromQuantity"))
             assert len(units) > 0, f"Quantity shape {shape_name} has no units"
-            Collection(G, enumeration, units)
+            add_rdf_list(enumeration, units)
         if "properties" in defn:
             prop_defns = defn.pop("properties")
             define_shape_property_property(shape_name, prop_defns)
         elif "datatype" in defn:
-            G.add((shape_name, SH.property, brick_value_shape))
-            G.add((brick_value_shape, A, SH.PropertyShape))
-            G.add((brick_value_shape, SH.path, BRICK.value))
             dtype = defn.pop("datatype")
             if dtype == BSH.NumericValue:
                 G.add((brick_value_shape, SH["or"], BSH.NumericValue))
             else:
                 G.add((brick_value_shape, SH.datatype, dtype))
-            G.add((brick_value_shape, SH.minCount, Literal(1)))
             if "range" in defn:
                 for prop_name, prop_value in defn.pop("range").items():
                     if prop_name not in [
@@ -588,65 +647,78 @@ def define_relationships(definitions, superprop=None):
     if len(definitions) == 0:
         return
 
-    for prop, propdefn in definitions.items():
+    # collect the triples for these relationships and add them in one batch.
+    # Subproperties are visited depth-first, in the same order as a recursive
+    # descent; each entry holds the relationships left at one level along
+    # with their superproperty
+    triples = []
+    stack = [(iter(definitions.items()), superprop)]
+    while stack:
+        props, superprop = stack[-1]
+        entry = next(props, None)
+        if entry is None:
+            stack.pop()
+            continue
+        prop, propdefn = entry
         if isinstance(prop, str):
             prop = BRICK[prop]
         if superprop is not None:
-            G.add((prop, RDFS.subPropertyOf, superprop))
+            triples.append((prop, RDFS.subPropertyOf, superprop))
 
-        G.add((prop, RDFS.subPropertyOf, BRICK.Relationship))
+        triples.append((prop, RDFS.subPropertyOf, BRICK.Relationship))
 
         # define property types
         prop_types = propdefn.get(A, [])
-        assert isinstance(prop_types, list)
+        assert isinstance(prop_types, (list, tuple))
         for prop_type in prop_types:
-            G.add((prop, A, prop_type))
-
-        # define any subproperties
-        subproperties_def = propdefn.get("subproperties", {})
-        assert isinstance(subproperties_def, dict)
-        define_relationships(subproperties_def, prop)
+            triples.append((prop, A, prop_type))
 
         # generate a SHACL Property Shape for this relationship
-        propshape = BSH[f"{prop.split('#')[-1]}Shape"]
-        G.add((propshape, A, SH.PropertyShape))
-        G.add((propshape, SH.path, prop))
-        if "range" in propdefn.keys():
-            range_defn = propdefn.pop("range")
+        propshape = BSH[f"{prop.rsplit('#', 1)[-1]}Shape"]
+        triples.append((propshape, A, SH.PropertyShape))
+        triples.append((propshape, SH.path, prop))
+        if RANGE in propdefn.keys():
+            range_defn = propdefn[RANGE]
             if isinstance(range_defn, (tuple, list)):
                 enumeration = BNode()
-                G.add((propshape, SH["or"], enumeration))
+                triples.append((propshape, SH["or"], enumeration))
                 constraints = []
                 for cls in range_defn:
                     constraint = BNode()
-                    G.add((constraint, SH["class"], cls))
+                    triples.append((constraint, SH["class"], cls))
                     constraints.append(constraint)
-                Collection(G, enumeration, constraints)
+                triples.extend(rdf_list_triples(enumeration, constraints))
             elif range_defn is not None:
-                G.add((propshape, SH["class"], range_defn))
+                triples.append((propshape, SH["class"], range_defn))
 
-        if "datatype" in propdefn.keys():
-            dtype_defn = propdefn.pop("datatype")
+        if DATATYPE in propdefn.keys():
+            dtype_defn = propdefn[DATATYPE]
             if dtype_defn == BSH.NumericValue:
-                G.add((propshape, SH["or"], BSH.NumericValue))
+                triples.append((propshape, SH["or"], BSH.NumericValue))
             else:
-                G.add((propshape, SH.datatype, dtype_defn))
+                triples.append((propshape, SH.datatype, dtype_defn))
 
-        if "domain" in propdefn.keys():
+        if DOMAIN in propdefn.keys():
             # associate the PropertyShape with all possible subject classes
-            domains = propdefn.pop("domain")
-            if not isinstance(domains, list):
+            domains = propdefn[DOMAIN]
+            if not isinstance(domains, (list, tuple)):
                 domains = [domains]
             for domain in domains:
-                G.add((domain, SH.property, propshape))
+                triples.append((domain, SH.property, propshape))
 
-        # define other properties of the Brick property
-        expected_properties = ["subproperties", A]
+        # define other properties of the Brick property. The definitions
+        # are read-only, so skip the keys consumed above rather than popping them
         other_properties = [
-            prop for prop in propdefn.keys() if prop not in expected_properties
+            prop for prop in propdefn.keys() if prop not in RELATIONSHIP_KEYS
         ]
         add_relationships(prop, {k: propdefn[k] for k in other_properties})
 
+        # define any subproperties
+        subproperties_def = propdefn.get("subproperties", {})
+        assert isinstance(subproperties_def, Mapping)
+        stack.append((iter(subproperties_def.items()), prop))
+    G.addN((s, p, o, G) for s, p, o in triples)
+
 
 def add_definitions():
     """
@@ -656,19 +728,27 @@ def add_definitions():
     adds it to the graph. If available, adds the source information of
     through RDFS.seeAlso.
     """
-    with open("./bricksrc/definitions.csv", encoding="utf-8") as dictionary_file:
+    import csv
+
+    with open(
+        "./bricksrc/definitions.csv", encoding="utf-8", newline=""
+    ) as dictionary_file:
         dictionary = csv.reader(dictionary_file)
 
         # skip the header
         next(dictionary)
 
         # add definitions, citations to the graph
+        triples = []
         for definition in dictionary:
             term = URIRef(definition[0])
             if len(definition[1]):
-                G.add((term, SKOS.definition, Literal(definition[1], lang="en")))
+                triples.append(
+                    (term, SKOS.definition, Literal(definition[1], lang="en"))
+                )
             if len(definition[2]):
-                G.add((term, RDFS.seeAlso, URIRef(definition[2])))
+                triples.append((term, RDFS.seeAlso, URIRef(definition[2])))
+        G.addN((s, p, o, G) for s, p, o in triples)
 
     qstr = """
     select ?param where {
@@ -677,8 +757,12 @@ def add_definitions():
     """
     limit_def_template = "A parameter that places {direction} bound on the range of permitted values of a {setpoint}."
     params = [row["param"] for row in G.query(qstr)]
+    # brick:Class and all of its subclasses, to check the inferred setpoints
+    brick_classes = set(G.transitive_subjects(RDFS.subClassOf, BRICK.Class))
+    triples = []
     for param in params:
-        words = param.split("#")[-1].split("_")
+        param_name = param.rsplit("#", 1)[-1]
+        words = param_name.split("_")
         prefix = words[0]
 
         # define "direction" component of Limit definition
@@ -691,7 +775,7 @@ def add_definitions():
             direction = "a lower or upper"
 
         # define the "setpoint" component of a Limit definition
-        if param.split("#")[-1] in ["Max_Limit", "Min_Limit", "Limit"]:
+        if param_name in ["Max_Limit", "Min_Limit", "Limit"]:
             setpoint = "Setpoint"
         else:
             if prefix:
@@ -707,16 +791,10 @@ def add_definitions():
             logging.info(f"Inferred setpoint: {setpoint}")
         limit_def = limit_def_template.format(direction=direction, setpoint=setpoint)
         if param != BRICK.Limit:  # definition already exists for Limit
-            G.add((param, SKOS.definition, Literal(limit_def, lang="en")))
-        class_exists = G.query(
-            f"""select ?class where {{
-            BIND(brick:{setpoint} as ?class)
-            ?class rdfs:subClassOf* brick:Class.
-        }}
-        """
-        ).bindings
-        if not class_exists:
+            triples.append((param, SKOS.definition, Literal(limit_def, lang="en")))
+        if BRICK[setpoint] not in brick_classes:
             logging.warning(f"WARNING: {setpoint} does not exist in Brick for {param}.")
+    G.addN((s, p, o, G) for s, p, o in triples)
 
 
 """ def handle_deprecations():
@@ -782,14 +860,40 @@ def add_definitions():
  """
 
 
+def merge_graph(graph):
+    """
+    Adds the triples of 'graph' to G in one batch, along with the prefixes
+    bound in 'graph' that G does not already bind. Files are parsed into a
+    separate graph and merged this way rather than parsed into G directly
+    """
+    G.addN((s, p, o, G) for s, p, o in graph)
+    for prefix, namespace in graph.namespace_manager.namespaces():
+        G.bind(prefix, namespace, override=False)
+
+
+def end_with_single_newline(fp):
+    """
+    Replaces the trailing whitespace that the turtle serializer leaves at the
+    end of 'fp' (a binary file opened for reading and writing) with a single
+    newline
+    """
+    end = fp.seek(0, os.SEEK_END)
+    tail_start = fp.seek(max(0, end - 64))
+    tail = fp.read()
+    fp.seek(tail_start + len(tail.rstrip()))
+    fp.truncate()
+    fp.write(b"\n")
+
+
 def handle_deprecations():
+    triples = []
     for deprecated_term, md in deprecations.items():
-        G.add((deprecated_term, A, OWL.Class))
-        G.add((deprecated_term, OWL.deprecated, Literal(True)))
-        label = deprecated_term.split("#")[-1].replace("_", " ")
-        G.add(
-            (deprecated_term, RDFS.label, Literal(label))
-        )  # make sure the tag is declared as such
+        triples.append((deprecated_term, A, OWL.Class))
+        triples.append((deprecated_term, OWL.deprecated, TRUE))
+        label = deprecated_term.rpartition("#")[2].replace("_", " ")
+        # make sure the tag is declared as such
+        triples.append((deprecated_term, RDFS.label, Literal(label)))
+        labeled_subjects.add(deprecated_term)
         # handle subclasses or skos
         if RDFS.subClassOf in md:
             subclasses = md.pop(RDFS.subClassOf)
@@ -797,28 +901,93 @@ def handle_deprecations():
                 if not isinstance(subclasses, list):
                     subclasses = [subclasses]
                 for subclass in subclasses:
-                    G.add((deprecated_term, RDFS.subClassOf, subclass))
+                    triples.append((deprecated_term, RDFS.subClassOf, subclass))
         elif SKOS.narrower in md:
             subconcepts = md.pop(SKOS.narrower)
             if subconcepts is not None:
                 if not isinstance(subconcepts, list):
                     subconcepts = [subconcepts]
                 for subclass in subconcepts:
-                    G.add((deprecated_term, SKOS.narrower, subclass))
-        G.add((deprecated_term, BRICK.deprecatedInVersion, Literal(md["version"])))
-        G.add(
+                    triples.append((deprecated_term, SKOS.narrower, subclass))
+        triples.append(
+            (deprecated_term, BRICK.deprecatedInVersion, Literal(md["version"]))
+        )
+        triples.append(
             (
                 deprecated_term,
                 BRICK.deprecationMitigationMessage,
                 Literal(md["mitigation_message"]),
             )
         )
-        G.add((deprecated_term, BRICK.isReplacedBy, md["replace_with"]))
+        triples.append((deprecated_term, BRICK.isReplacedBy, md["replace_with"]))
+    G.addN((s, p, o, G) for s, p, o in triples)
+
+
+def saved_imports_are_fresh(paths):
+    """
+    Returns True if all of the saved imports exist and are newer than the
+    sources they are resolved from: the list of imports in
+    bricksrc/ontology.py and the local copies of the imported ontologies in
+    ./support, which ontoenv maps the import URIs to. The ./support
+    directory itself is included so that added, removed or renamed files
+    count as changes. Also returns False if ontoenv has no mapping yet
+    """
+    if not Path(".ontoenv", "mapping.json").exists():
+        return False
+    support = Path("support")
+    sources = [Path("bricksrc") / "ontology.py", support, *support.glob("*.ttl")]
+    source_mtime = max(os.path.getmtime(source) for source in sources)
+    return all(
+        path.exists() and os.path.getmtime(path) > source_mtime for path in paths
+    )
+
+
+def add_imports(graph):
+    """
+    Resolves the ontologies imported by Brick, saves a copy of each to
+    ./imports and adds them to 'graph' so it can be validated. If the saved
+    copies are up to date they are used instead, without resolving anything
+    """
+    saved = [Path("imports") / f"{name}.ttl" for name in ontology_imports]
+    if saved_imports_are_fresh(saved):
+        logging.info("Using the saved imports in ./imports")
+        for path in saved:
+            graph.parse(path, format="ttl")
+        return
+
+    # ontoenv (like pyshacl, below) is only needed once Brick has been
+    # generated, so it is imported here rather than at startup
+    import ontoenv
+
+    # create new directory for storing imports
+    os.makedirs("imports", exist_ok=True)
+    env = ontoenv.OntoEnv(initialize=True)
+    env.refresh()
+    for name, uri in ontology_imports.items():
+        depg, loc = env.resolve_uri(str(uri))
+        depg.serialize(Path("imports") / f"{name}.ttl", format="ttl")
+        graph += depg
+
+
+def validate(graph):
+    """
+    Validates 'graph' against its SHACL shapes; prints the report and
+    exits if it does not conform
+    """
+    import pyshacl
+
+    valid, _, report = pyshacl.validate(
+        data_graph=graph, advanced=True, allow_warnings=True
+    )
+    if not valid:
+        print(report)
+        sys.exit(1)
 
 
 logging.info("Beginning BRICK Ontology compilation")
 # handle ontology definition
 define_ontology(G)
+labeled_subjects.update(G.subjects(predicate=RDFS.label))
 
 # Declare root classes
 
@@ -843,7 +1012,7 @@ define_classes(roots, BRICK.Entity)  # >= Brick v1.3.0
 logging.info("Defining properties")
 # define BRICK properties
 G.add((BRICK.Relationship, A, OWL.ObjectProperty))
-G.add((BRICK.Relationship, RDFS.label, Literal("Relationship")))
+add_label(BRICK.Relationship, "Relationship")
 G.add(
     (
         BRICK.Relationship,
@@ -869,9 +1038,12 @@ define_classes(parameter_definitions, BRICK.Point)
 
 # make points disjoint
 pointclasses = ["Alarm", "Status", "Command", "Setpoint", "Sensor", "Parameter"]
-for pc in pointclasses:
-    for o in filter(lambda x: x != pc, pointclasses):
-        G.add((BRICK[pc], OWL.disjointWith, BRICK[o]))
+# both directions are stated so consumers don't need a reasoner to see
+# that owl:disjointWith is symmetric
+G.addN(
+    (BRICK[pc], OWL.disjointWith, BRICK[o], G)
+    for pc, o in permutations(pointclasses, 2)
+)
 
 logging.info("Defining Equipment, System and Location subclasses")
 # define other root class structures
@@ -886,25 +1058,26 @@ define_classes(safety_subclasses, BRICK.Safety_Equipment)
 
 logging.info("Defining Measurable hierarchy")
 # define measurable hierarchy
-G.add((BRICK.Measurable, RDFS.subClassOf, BRICK.Entity))
-# set up Quantity definition
-G.add((BRICK.Quantity, RDFS.subClassOf, SOSA.ObservableProperty))
-G.add((BRICK.Quantity, RDFS.subClassOf, QUDT.QuantityKind))
-G.add(
-    (SOSA.ObservableProperty, A, OWL.Class)
-)  # needs the type declaration to satisfy some checkers
-G.add((BRICK.Quantity, RDFS.subClassOf, BRICK.Measurable))
-G.add((BRICK.Quantity, A, OWL.Class))
-G.add((BRICK.Quantity, RDFS.label, Literal("Quantity")))
-G.add((BRICK.Quantity, RDFS.subClassOf, SKOS.Concept))
-# set up Substance definition
-G.add((BRICK.Substance, RDFS.subClassOf, SOSA.FeatureOfInterest))
-G.add(
-    (SOSA.FeatureOfInterest, A, OWL.Class)
-)  # needs the type declaration to satisfy some checkers
-G.add((BRICK.Substance, RDFS.subClassOf, BRICK.Measurable))
-G.add((BRICK.Substance, A, OWL.Class))
-G.add((BRICK.Substance, RDFS.label, Literal("Substance")))
+STATIC_TRIPLES = (
+    (BRICK.Measurable, RDFS.subClassOf, BRICK.Entity),
+    # set up Quantity definition
+    (BRICK.Quantity, RDFS.subClassOf, SOSA.ObservableProperty),
+    (BRICK.Quantity, RDFS.subClassOf, QUDT.QuantityKind),
+    # needs the type declaration to satisfy some checkers
+    (SOSA.ObservableProperty, A, OWL.Class),
+    (BRICK.Quantity, RDFS.subClassOf, BRICK.Measurable),
+    (BRICK.Quantity, A, OWL.Class),
+    (BRICK.Quantity, RDFS.subClassOf, SKOS.Concept),
+    # set up Substance definition
+    (BRICK.Substance, RDFS.subClassOf, SOSA.FeatureOfInterest),
+    # needs the type declaration to satisfy some checkers
+    (SOSA.FeatureOfInterest, A, OWL.Class),
+    (BRICK.Substance, RDFS.subClassOf, BRICK.Measurable),
+    (BRICK.Substance, A, OWL.Class),
+)
+G.addN((s, p, o, G) for s, p, o in STATIC_TRIPLES)
+add_label(BRICK.Quantity, "Quantity")
+add_label(BRICK.Substance, "Substance")
 
 # We make the punning explicit here. Any subclass of brick:Substance
 # is itself a substance or quantity. There is one canonical instance of
@@ -920,26 +1093,22 @@ define_concept_hierarchy(substances, [BRICK.Substance])
 # this defines the SKOS-based concept hierarchy for BRICK Quantities
 define_concept_hierarchy(quantity_definitions, [BRICK.Quantity])
 
-# add any missing skos:narrower implied by skos:broader where the subject
-# is defined by the Brick ontology
-G.query(
-    """CONSTRUCT {
-    ?narrower skos:broader ?broader .
-} WHERE {
-    ?broader skos:narrower ?narrower .
-    ?narrower rdf:type/rdfs:subClassOf* brick:Entity
-}"""
-)
-# add any missing skos:broader implied by skos:narrower where the subject
-# is defined by the Brick ontology
-G.query(
-    """CONSTRUCT {
-    ?broader skos:narrower ?narrower .
-} WHERE {
-    ?narrower skos:broader ?broader .
-    ?broader rdf:type/rdfs:subClassOf* brick:Entity
-}"""
+# add any missing skos:broader implied by skos:narrower, and any missing
+# skos:narrower implied by skos:broader, where the subject is defined by the
+# Brick ontology (i.e. is an instance of brick:Entity or one of its subclasses)
+entity_classes = set(G.transitive_subjects(RDFS.subClassOf, BRICK.Entity))
+entities = {s for s, o in G.subject_objects(A) if o in entity_classes}
+inverse_skos = [
+    (narrower, SKOS.broader, broader)
+    for broader, narrower in G.subject_objects(SKOS.narrower)
+    if narrower in entities
+]
+inverse_skos.extend(
+    (broader, SKOS.narrower, narrower)
+    for narrower, broader in G.subject_objects(SKOS.broader)
+    if broader in entities
 )
+G.addN((s, p, o, G) for s, p, o in inverse_skos)
 
 # for all Quantities, copy part of the QUDT unit definitions over
 res = G.query(
@@ -954,15 +1123,22 @@ res = G.query(
 # with QUDT units via the "hasQUDTReference" property; the second pass
 # traverses the SKOS broader/narrower hierarchy to inherit associated units
 # "up" into the broader concepts.
-for r in res:
-    brick_quant, qudt_quant = r
-    for (unit,) in get_units(qudt_quant):
-        G.add((brick_quant, QUDT.applicableUnit, unit))
-for r in res:
-    brick_quant, qudt_quant = r
-    # the symbols, units, and labels are already defined in the previous pass
-    for unit, symb, label in get_units_brick(brick_quant):
-        G.add((brick_quant, QUDT.applicableUnit, unit))
+G.addN(
+    (brick_quant, QUDT.applicableUnit, unit, G)
+    for brick_quant, qudt_quant in res
+    for unit in get_units(qudt_quant)
+)
+# the symbols, units, and labels are already defined in the previous pass
+G.update(
+    """INSERT {
+    ?quantity qudt:applicableUnit ?unit .
+} WHERE {
+    ?quantity rdf:type brick:Quantity .
+    ?quantity brick:hasQUDTReference ?qudtquant .
+    ?subquant skos:broader+ ?quantity .
+    ?subquant qudt:applicableUnit ?unit .
+}"""
+)
 # all QUDT units
 # for unit, symb, label in all_units():
 #    G.add((unit, A, QUDT.Unit))
@@ -989,47 +1165,42 @@ logging.info("Adding class definitions")
 add_definitions()
 
 # add all TTL files in bricksrc
+bricksrc_ttl = Graph()
 for ttlfile in glob.glob("bricksrc/*.ttl"):
-    G.parse(ttlfile, format="turtle")
+    bricksrc_ttl.parse(ttlfile, format="turtle")
+merge_graph(bricksrc_ttl)
 
-# add ref-schema definitions
-G.parse("support/ref-schema.ttl", format="turtle")
+# add ref-schema definitions, without the ref-schema ontology header. The
+# header is removed from the (small) parsed file rather than from G
+ref_schema = Graph().parse("support/ref-schema.ttl", format="turtle")
 ref_schema_uri = URIRef(REF.strip("#"))
-for triple in G.cbd(ref_schema_uri):
-    G.remove(triple)
+ref_schema -= ref_schema.cbd(ref_schema_uri)
+merge_graph(ref_schema)
 
 logging.info(f"Brick ontology compilation finished! Generated {len(G)} triples")
 
 extension_graphs = {"shacl_tag_inference": shaclGraph}
 
-# serialize extensions to output
+# serialize extensions to output. The graphs are streamed to the files
+# rather than serialized to a string first
 for name, graph in extension_graphs.items():
-    with open(f"extensions/brick_extension_{name}.ttl", "w", encoding="utf-8") as fp:
+    with open(f"extensions/brick_extension_{name}.ttl", "w+b") as fp:
         # need to write this manually; turtle serializer doesn't always add
-        fp.write("@prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .\n")
-        fp.write(graph.serialize(format="turtle").rstrip())
-        fp.write("\n")
+        fp.write(b"@prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .\n")
+        graph.serialize(destination=fp, format="turtle", encoding="utf-8")
+        end_with_single_newline(fp)
 
 # serialize Brick to output
-with open("Brick.ttl", "w", encoding="utf-8") as fp:
-    fp.write(G.serialize(format="turtle").rstrip())
-    fp.write("\n")
+with open("Brick.ttl", "w+b") as fp:
+    G.serialize(destination=fp, format="turtle", encoding="utf-8")
+    end_with_single_newline(fp)
 
 # remove extensions file before computing imports
 if os.path.exists("Brick+extensions.ttl"):
     os.remove("Brick+extensions.ttl")
 
-# create new directory for storing imports
-os.makedirs("imports", exist_ok=True)
-env = ontoenv.OntoEnv(initialize=True)
-env.refresh()
-for name, uri in ontology_imports.items():
-    depg, loc = env.resolve_uri(str(uri))
-    depg.serialize(Path("imports") / f"{name}.ttl", format="ttl")
-    G += depg  # add the imported graph to Brick so we can do validation
+# add the imported graphs to Brick so we can do validation
+add_imports(G)
 
 # validate Brick
-valid, _, report = pyshacl.validate(data_graph=G, advanced=True, allow_warnings=True)
-if not valid:
-    print(report)
-    sys.exit(1)
+validate(G)
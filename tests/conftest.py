@@ -10,6 +10,8 @@ import sys
 sys.path.append("..")
 from bricksrc.namespaces import QUDT, RDF, RDFS, BRICK  # noqa: E402
 
+EXAMPLE_FILES = glob.glob("examples/*/*.ttl")
+
 
 def pytest_generate_tests(metafunc):
     """
@@ -18,10 +20,7 @@ def pytest_generate_tests(metafunc):
 
     # validates that example files pass validation
     if "filename" in metafunc.fixturenames:
-        # example_files_1 = glob.glob("examples/*.ttl")
-        example_files = glob.glob("examples/*/*.ttl")
-        # example_files = set(example_files_1 + example_files_2)
-        metafunc.parametrize("filename", example_files)
+        metafunc.parametrize("filename", EXAMPLE_FILES)
 
 
 def pytest_configure(config):
@@ -30,8 +29,11 @@ def pytest_configure(config):
     )
 
 
-@pytest.fixture()
-def brick_with_imports():
+@pytest.fixture(scope="session")
+def _brick_with_imports():
+    """
+    Brick and its imports, parsed once per test session
+    """
     env = ontoenv.OntoEnv()
     g = brickschema.graph.Graph()
     g.load_file("Brick.ttl")
@@ -41,3 +43,13 @@ def brick_with_imports():
     g.bind("brick", BRICK)
     env.import_dependencies(g)
     return g
+
+
+@pytest.fixture()
+def brick_with_imports(_brick_with_imports):
+    # tests expand and add to the graph, so each one gets its own copy
+    g = brickschema.graph.Graph()
+    g += _brick_with_imports
+    for prefix, namespace in _brick_with_imports.namespaces():
+        g.bind(prefix, namespace)
+    return g
@@ -1,9 +1,10 @@
 import brickschema
+import pytest
 from brickschema.namespaces import BRICK, RDFS
 import sys
 
 sys.path.append("..")
-from bricksrc.relationships import relationships  # noqa:E402
+from bricksrc.relationships import relationships, inverse_of, _freeze  # noqa:E402
 
 
 def test_relationship_identification():
@@ -12,3 +13,24 @@ def test_relationship_identification():
 
     relships = list(g.subjects(RDFS.subPropertyOf, BRICK.Relationship))
     assert len(relships) == len(relationships)
+
+
+def test_inverse_index():
+    assert len(inverse_of) > 0
+    for prop, inverse in inverse_of.items():
+        assert inverse_of[inverse] == prop
+        assert prop.startswith(BRICK) and prop.split("#")[-1] in relationships
+
+
+def test_frozen_subproperties():
+    defn = _freeze(
+        {
+            RDFS.label: "Parent",
+            "subproperties": {"child": {RDFS.label: "Child"}},
+        }
+    )
+    assert defn in {defn}
+    child = defn["subproperties"]["child"]
+    assert child[RDFS.label].value == "Child"
+    with pytest.raises(TypeError):
+        defn["subproperties"]["other"] = {}